@@ -1,10 +1,23 @@
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import json
 import os
-import html
+import shutil
+import tempfile
+import threading
 from datetime import datetime, timezone
+from string import Template
 
+import anyio.to_thread
 import docker
+import markupsafe
+import zstandard
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 
 APP_TITLE = "NPMplus Nginx Config Console"
 
@@ -12,21 +25,80 @@ NPMPLUS_CONTAINER = os.getenv("NPMPLUS_CONTAINER", "npmplus")
 BASIC_USER = os.getenv("BASIC_AUTH_USER", "").strip()
 BASIC_PASS = os.getenv("BASIC_AUTH_PASS", "").strip()
 MAX_CHARS = int(os.getenv("MAX_CHARS", "5000000"))  # 5MB default
+MAX_CACHE_BYTES = int(os.getenv("MAX_CACHE_BYTES", "33554432"))  # 32MB: Budget für aktuellen + vorherigen Snapshot
 
 app = FastAPI(title=APP_TITLE)
+# nginx-Configs sind extrem repetitiv -> gzip drückt /config.txt & Co. ~10x
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 CACHE = {
-    "text": "",
+    "text": "",  # einmal im Postprocess aus text_bytes dekodiert (diff/authentik)
+    "text_bytes": b"",  # Roh-Output von nginx -T, Primärkopie für alle Endpoints
+    "index": [],  # Struktur-Index, einmal pro Fetch geparst
+    "index_js": "[]",  # derselbe Index als JSON für die Seiten-Einbettung
+    "stats": None,  # {lines, bytes}; erspart dem Client das Zeilenzählen
+    "stats_js": "null",  # Stats als JSON für die Seiten-Einbettung
+    "hash": b"",  # blake2b über text_bytes, für Gleichheits-Shortcut in /diff und ETag
+    "etag": "",  # ETag für /config.txt, aus dem Hash abgeleitet
+    "derived_for": None,  # ts, für den die abgeleiteten Felder oben berechnet wurden
     "ts": None,   # UTC datetime
+    "ts_iso": "",  # einmal pro Fetch formatiert
+    "ts_human": "—",
     "err": None,
     "exit_code": None,
+    "exit_chip_class": "warn",  # ok/bad/warn, einmal pro Fetch bestimmt
+    "exit_val": "",
 }
 
+# Der vorherige Snapshot wird nur noch von /diff gebraucht -> zstd-komprimiert
+# halten (nginx-Configs schrumpfen ~10x) statt als zweiter 5-MB-String
 PREV = {
-    "text": "",
+    "z": b"",
+    "hash": b"",
     "ts": None,
 }
 
+_ZSTD_C = zstandard.ZstdCompressor(level=3)
+_ZSTD_D = zstandard.ZstdDecompressor()
+
+@functools.lru_cache(maxsize=2)
+def _decompress_text(z: bytes) -> str:
+    return _ZSTD_D.decompress(z).decode("utf-8", errors="replace")
+
+_DERIVED_LOCK = threading.Lock()
+
+def _ensure_derived():
+    """
+    Berechnet die von den Snapshot-Bytes abgeleiteten Felder (dekodierter
+    Text, JS/JSON-Blobs, Hash). Läuft normalerweise als BackgroundTask direkt nach
+    /fetch; Endpoints rufen es zusätzlich als Lazy-Fallback auf, falls ein
+    Request schneller ist als der Postprocess.
+    """
+    if CACHE["derived_for"] is CACHE["ts"]:
+        return
+    with _DERIVED_LOCK:
+        if CACHE["derived_for"] is CACHE["ts"]:
+            return
+
+        data = CACHE["text_bytes"]
+        ts = CACHE["ts"]
+        CACHE["text"] = data.decode("utf-8", errors="replace")
+        CACHE["index"] = build_config_index(CACHE["text"])
+        CACHE["index_js"] = json.dumps(CACHE["index"])
+        CACHE["stats"] = {"lines": data.count(b"\n") + 1 if data else 0, "bytes": len(data)}
+        CACHE["stats_js"] = json.dumps(CACHE["stats"])
+        CACHE["hash"] = hashlib.blake2b(data, digest_size=16).digest()
+        CACHE["etag"] = f'"{CACHE["hash"].hex()}"'
+
+        # Byte-Budget statt fixer Snapshot-Anzahl: sprengt aktueller Snapshot
+        # plus komprimierter Vorgänger das Limit, fliegt der Vorgänger raus
+        if len(CACHE["text_bytes"]) + len(PREV["z"]) > MAX_CACHE_BYTES:
+            PREV["z"] = b""
+            PREV["hash"] = b""
+            PREV["ts"] = None
+
+        CACHE["derived_for"] = ts
+
 import re
 
 AUTH_STRONG_PATTERNS = [
@@ -40,6 +112,40 @@ AUTH_WEAK_PATTERNS = [
 ]
 
 PROXY_FILE_RE = re.compile(r"^# configuration file\s+(/data/nginx/proxy_host/(\d+)\.conf):", re.M)
+SERVER_NAME_BLOCK_RE = re.compile(r"^\s*server_name\s+([^;]+);", re.M)
+
+# Struktur-Index über den nginx-T Dump (Dateien, http/stream/server-Blöcke);
+# wurde früher im Browser bei jedem Seitenaufruf neu gebaut. Eine einzige
+# Multiline-Regex statt Zeilenschleife: match.start() ist direkt der
+# Char-Offset, die lines-Liste wird hier nicht mehr gebraucht
+INDEX_RE = re.compile(
+    r"^(?:# configuration file (?P<file>.+)|\s*(?P<block>http|stream|server)\s*\{)",
+    re.M,
+)
+# Lookahead-Fenster für server_name hinter einem server { (ersetzt die
+# alten 40 Zeilen; server_name steht in der Praxis in den ersten Zeilen)
+SERVER_NAME_WINDOW = 4096
+
+def build_config_index(text: str) -> list[dict]:
+    """
+    Baut den Navigations-Index einmal pro Fetch:
+    - label, meta ("file" | "block" | "server"), pos (Char-Offset im Text)
+    """
+    items = []
+    for m in INDEX_RE.finditer(text):
+        pos = m.start()
+        if m.group("file") is not None:
+            items.append({"label": m.group("file").strip(), "meta": "file", "pos": pos})
+            continue
+        kind = m.group("block")
+        if kind == "server":
+            nm = SERVER_NAME_BLOCK_RE.search(text, m.end(), m.end() + SERVER_NAME_WINDOW)
+            name = nm.group(1).strip() if nm else ""
+            label = f"server {{ {name} }}" if name else "server { ... }"
+            items.append({"label": label, "meta": "server", "pos": pos})
+        else:
+            items.append({"label": f"{kind} {{ ... }}", "meta": "block", "pos": pos})
+    return items
 
 def parse_proxy_hosts_authentik(nginx_T_text: str):
     """
@@ -63,7 +169,7 @@ def parse_proxy_hosts_authentik(nginx_T_text: str):
 
         # server_name(s) innerhalb dieser conf
         server_names = []
-        for sm in re.finditer(r"^\s*server_name\s+([^;]+);", block, re.M):
+        for sm in SERVER_NAME_BLOCK_RE.finditer(block):
             # kann mehrere Namen enthalten
             names = [x.strip() for x in sm.group(1).split() if x.strip()]
             server_names.extend(names)
@@ -98,63 +204,122 @@ def parse_proxy_hosts_authentik(nginx_T_text: str):
     results.sort(key=lambda r: (r["uses_authentik"], int(r["id"])))
     return results
 
+def _iter_chunks(data: bytes, size: int = 64 * 1024):
+    """Liefert die gecachten Bytes häppchenweise, statt den ganzen Body zu puffern."""
+    mv = memoryview(data)
+    for i in range(0, len(mv), size):
+        yield bytes(mv[i:i + size])
+
+# GNU/busybox diff (Myers in C) ist um Größenordnungen schneller als difflib
+# auf den bis zu MAX_CHARS großen nginx-T Dumps
+_DIFF_BIN = shutil.which("diff")
+
+async def _unified_diff(old: str, new: str, fromfile: str, tofile: str) -> str:
+    if _DIFF_BIN:
+        with tempfile.NamedTemporaryFile("w", suffix=".prev", encoding="utf-8") as fa, \
+             tempfile.NamedTemporaryFile("w", suffix=".curr", encoding="utf-8") as fb:
+            fa.write(old)
+            fa.flush()
+            fb.write(new)
+            fb.flush()
+            proc = await asyncio.create_subprocess_exec(
+                _DIFF_BIN, "-u", "-L", fromfile, "-L", tofile, fa.name, fb.name,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            out, _ = await proc.communicate()
+            # 0 = gleich, 1 = Unterschiede; alles andere -> Fallback
+            if proc.returncode in (0, 1):
+                return out.decode("utf-8", errors="replace")
+
+    import difflib
+    udiff = difflib.unified_diff(
+        old.splitlines(), new.splitlines(),
+        fromfile=fromfile, tofile=tofile, lineterm=""
+    )
+    return "\n".join(udiff) + "\n"
+
+# einmal beim Start statt pro Request: Auth-Flag und der komplette erwartete
+# Authorization-Header; pro Request bleibt ein einziger compare_digest
+_AUTH_ENABLED = bool(BASIC_USER and BASIC_PASS)
+_EXPECTED_AUTH = b"Basic " + base64.b64encode(f"{BASIC_USER}:{BASIC_PASS}".encode("utf-8"))
+
 def _check_basic_auth(request: Request):
-    if not (BASIC_USER and BASIC_PASS):
+    if not _AUTH_ENABLED:
         return  # auth disabled
 
-    auth = request.headers.get("authorization", "")
-    if not auth.lower().startswith("basic "):
+    auth = request.headers.get("authorization", "").encode("utf-8", errors="replace")
+    if not hmac.compare_digest(auth, _EXPECTED_AUTH):
         raise HTTPException(status_code=401, detail="Auth required", headers={"WWW-Authenticate": "Basic"})
 
-    import base64
-    try:
-        raw = base64.b64decode(auth.split(" ", 1)[1]).decode("utf-8")
-        user, pwd = raw.split(":", 1)
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid auth", headers={"WWW-Authenticate": "Basic"})
+# Ein Client für den ganzen Prozess: docker.from_env() öffnet sonst bei jedem
+# Fetch eine neue Unix-Socket-Session inkl. Versions-Handshake
+_DOCKER: docker.DockerClient | None = None
 
-    if user != BASIC_USER or pwd != BASIC_PASS:
-        raise HTTPException(status_code=401, detail="Invalid auth", headers={"WWW-Authenticate": "Basic"})
+def _get_docker() -> docker.DockerClient:
+    global _DOCKER
+    if _DOCKER is None:
+        _DOCKER = docker.from_env(timeout=30)
+    return _DOCKER
 
-def fetch_nginx_T() -> tuple[str, int]:
-    client = docker.from_env()
+def fetch_nginx_T() -> tuple[bytes, int]:
+    global _DOCKER
+    client = _get_docker()
     try:
         c = client.containers.get(NPMPLUS_CONTAINER)
-    except Exception as e:
+    except docker.errors.NotFound as e:
         raise RuntimeError(f"Container '{NPMPLUS_CONTAINER}' nicht gefunden: {e}")
+    except Exception as e:
+        # Socket/Daemon-Problem: Client verwerfen, der nächste Fetch verbindet neu
+        _DOCKER = None
+        raise RuntimeError(f"Docker-Verbindung fehlgeschlagen: {e}")
 
-    # nginx -T schreibt häufig auf stderr; wir nehmen beides zusammen
-    res = c.exec_run(["nginx", "-T"], stdout=True, stderr=True)
-    out = res.output.decode("utf-8", errors="replace")
-    code = int(getattr(res, "exit_code", 0) or 0)
-
-    if len(out) > MAX_CHARS:
-        out = out[:MAX_CHARS] + "\n\n[TRUNCATED: output exceeded MAX_CHARS]\n"
+    try:
+        # nginx -T schreibt häufig auf stderr; wir nehmen beides zusammen.
+        # Gestreamt statt exec_run: so wird nie mehr als MAX_CHARS gepuffert
+        # und bei zu großem Output brechen wir das Lesen ab, statt erst den
+        # kompletten Dump in den Speicher zu holen und dann zu kappen
+        exec_id = client.api.exec_create(c.id, ["nginx", "-T"], stdout=True, stderr=True)["Id"]
+        stream = client.api.exec_start(exec_id, stream=True)
+        buf = bytearray()
+        truncated = False
+        for chunk in stream:
+            buf += chunk
+            if len(buf) > MAX_CHARS:
+                del buf[MAX_CHARS:]
+                truncated = True
+                break
+        code = int(client.api.exec_inspect(exec_id).get("ExitCode") or 0)
+    except Exception as e:
+        _DOCKER = None
+        raise RuntimeError(f"nginx -T exec fehlgeschlagen: {e}")
+    # Bytes bleiben Bytes: dekodiert wird erst einmalig im Postprocess,
+    # nicht hier und wieder zurück für jede Response
+    out = bytes(buf)
+    if truncated:
+        out += b"\n\n[TRUNCATED: output exceeded MAX_CHARS]\n"
     return out, code
 
-@app.get("/", response_class=HTMLResponse)
-def index(request: Request):
-    _check_basic_auth(request)
-
-    ts_iso = CACHE["ts"].isoformat() if CACHE["ts"] else ""
-    ts_human = CACHE["ts"].strftime("%Y-%m-%d %H:%M:%S UTC") if CACHE["ts"] else "—"
-    err = CACHE["err"] or ""
-    exit_code = CACHE["exit_code"]
-    has = bool(CACHE["text"])
-
-    # We embed current config as a JS string (escaped) for client-side indexing/search/diff.
-    # Important: HTML-escape for safety, then JSON-ish escaping via repr.
-    config_text = CACHE["text"] if has else ""
-    # Use Python repr to safely embed as JS string literal; later decode on client side
-    config_js_literal = repr(config_text)
-
-    page = f"""<!doctype html>
+@app.on_event("shutdown")
+def _close_docker():
+    global _DOCKER
+    if _DOCKER is not None:
+        _DOCKER.close()
+        _DOCKER = None
+
+# Die Seite ist bis auf wenige Werte statisch; das Shell-HTML wird deshalb
+# einmal beim Import gebaut (statische Substitutionen inline im f-string),
+# pro Request bleiben nur die $-Platzhalter unten übrig.
+_PAGE_TMPL = Template(f"""<!doctype html>
 <html lang="de">
 <head>
   <meta charset="utf-8"/>
   <meta name="viewport" content="width=device-width, initial-scale=1"/>
-  <title>{html.escape(APP_TITLE)}</title>
+  <title>{markupsafe.escape(APP_TITLE)}</title>
 
+  <!-- DNS+TLS zum CDN schon während des HTML-Parsens aufbauen -->
+  <link rel="preconnect" href="https://cdn.jsdelivr.net" crossorigin>
+  <link rel="preload" as="script" href="https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/lib/highlight.min.js">
   <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/styles/github-dark.min.css">
   <script src="https://cdn.jsdelivr.net/npm/highlight.js@11.9.0/lib/highlight.min.js"></script>
 
@@ -434,22 +599,20 @@ def index(request: Request):
 <header>
   <div class="topbar">
     <div class="title">
-      <div class="h">{html.escape(APP_TITLE)}</div>
+      <div class="h">{markupsafe.escape(APP_TITLE)}</div>
       <div class="sub">
-        <span class="chip"><span>Target</span> <b>{html.escape(NPMPLUS_CONTAINER)}</b></span>
-        <span class="chip" id="chip-ts"><span>Last fetch</span> <b>{html.escape(ts_human)}</b></span>
+        <span class="chip"><span>Target</span> <b>{markupsafe.escape(NPMPLUS_CONTAINER)}</b></span>
+        <span class="chip" id="chip-ts"><span>Last fetch</span> <b id="ts-val">$ts_human</b></span>
         <span class="chip" id="chip-age"><span>Age</span> <b id="age-val">—</b></span>
         <span class="chip" id="chip-stats"><span>Stats</span> <b id="stats-val">—</b></span>
-        <span class="chip {('ok' if exit_code == 0 else 'bad' if exit_code is not None else 'warn')}" id="chip-exit">
-          <span>Exit</span> <b id="exit-val">{'' if exit_code is None else str(exit_code)}</b>
+        <span class="chip $exit_chip_class" id="chip-exit">
+          <span>Exit</span> <b id="exit-val">$exit_val</b>
         </span>
       </div>
     </div>
 
     <div class="actions">
-      <form method="post" action="/fetch" style="margin:0;">
-        <button type="submit">Fetch nginx -T</button>
-      </form>
+      <button id="btn-fetch">Fetch nginx -T</button>
       <a class="btn secondary" href="/download">Download TXT</a>
       <a class="btn secondary" href="/raw" target="_blank">Raw</a>
       <a class="btn secondary" href="/authentik">Authentik Report</a>
@@ -513,7 +676,7 @@ def index(request: Request):
       </div>
     </div>
     <div class="codeWrap">
-      {"<div class='err'><b>Fehler:</b> " + html.escape(err) + "</div>" if err else ""}
+      $err_html
       <pre><code id="code" class="language-nginx"></code></pre>
     </div>
   </div>
@@ -521,8 +684,10 @@ def index(request: Request):
 
 <script>
   // ---- Embedded server cache (current snapshot) ----
-  const SERVER_TS_ISO = {repr(ts_iso)};
-  const CONFIG_TEXT = {config_js_literal};
+  // let statt const: doFetch() aktualisiert die Werte ohne Seiten-Reload
+  let SERVER_TS_ISO = $ts_iso_js;
+  let SERVER_INDEX = $index_js;
+  let SERVER_STATS = $stats_js;
 
   // ---- DOM ----
   const codeEl = document.getElementById("code");
@@ -532,7 +697,10 @@ def index(request: Request):
   const idxInfoEl = document.getElementById("idxinfo");
   const statsEl = document.getElementById("stats-val");
   const ageEl = document.getElementById("age-val");
+  const tsValEl = document.getElementById("ts-val");
   const exitValEl = document.getElementById("exit-val");
+  const chipExitEl = document.getElementById("chip-exit");
+  const btnFetch = document.getElementById("btn-fetch");
   const btnPrev = document.getElementById("btn-prev");
   const btnNext = document.getElementById("btn-next");
   const btnClear = document.getElementById("btn-clear");
@@ -543,7 +711,8 @@ def index(request: Request):
   const regexModeEl = document.getElementById("regexMode");
 
   // ---- State ----
-  let rawText = CONFIG_TEXT || "";
+  // Config kommt nicht mehr inline, sondern per /config.txt (ETag-gecacht)
+  let rawText = "";
   let lastRenderedText = "";
   let matches = [];
   let currentMatch = -1;
@@ -560,16 +729,16 @@ def index(request: Request):
     return x.toFixed(i===0?0:2) + " " + units[i];
   }}
 
-  function linesCount(s) {{
-    if (!s) return 0;
-    return (s.match(/\\n/g) || []).length + 1;
+  // Zeilen/Bytes kommen fertig gezählt vom Server; nur das Alter tickt lokal
+  function renderStats() {{
+    if (!SERVER_STATS) {{
+      statsEl.textContent = "—";
+      return;
+    }}
+    statsEl.textContent = `${{SERVER_STATS.lines.toLocaleString("de-DE")}} lines • ${{bytesHuman(SERVER_STATS.bytes)}}`;
   }}
 
-  function updateAgeAndStats() {{
-    const bytes = rawText.length;
-    const lines = linesCount(rawText);
-    statsEl.textContent = `${{lines.toLocaleString("de-DE")}} lines • ${{bytesHuman(bytes)}}`;
-
+  function updateAge() {{
     if (!SERVER_TS_ISO) {{
       ageEl.textContent = "—";
       return;
@@ -591,13 +760,10 @@ def index(request: Request):
     ageEl.textContent = s.trim();
   }}
 
+  // ein Scan statt fünf replaceAll-Durchläufe über den ganzen Text
+  const ESC_MAP = {{'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#039;'}};
   function escapeHtml(s) {{
-    return s
-      .replaceAll("&","&amp;")
-      .replaceAll("<","&lt;")
-      .replaceAll(">","&gt;")
-      .replaceAll('"',"&quot;")
-      .replaceAll("'","&#039;");
+    return s.replace(/[&<>"']/g, c => ESC_MAP[c]);
   }}
 
   function buildRegexFromQuery(q) {{
@@ -624,21 +790,24 @@ def index(request: Request):
     return new RegExp(pat, flags);
   }}
 
+  // einmal kompiliert statt bei jedem Klick durch buildRegexFromQuery
+  const PRESETS = {{
+    acme: /\\/\\.well-known\\/|acme-challenge|letsencrypt/gi,
+    crowdsec: /crowdsec|lua|bouncer|cscli|access_by_lua/gi,
+    geoip: /geoip|allowed_country|map \\$allowed_country|country_code/gi,
+    redirect: /return 30[12]|rewrite|server_redirect|301|302/gi,
+    proxyhost: /proxy_host|proxy_pass|upstream|include \\/data\\/nginx\\/proxy_host/gi,
+    errors: /\\[emerg\\]|\\[warn\\]|duplicate location|configuration file .* test failed/gi
+  }};
+
   function applyQuickFilter(tag) {{
-    // define a few nice presets
-    const presets = {{
-      acme: "/\\\\.well-known/|acme-challenge|letsencrypt",
-      crowdsec: "crowdsec|lua|bouncer|cscli|access_by_lua",
-      geoip: "geoip|allowed_country|map \\\\\\$allowed_country|country_code",
-      redirect: "return 30[12]|rewrite|server_redirect|301|302",
-      proxyhost: "proxy_host|proxy_pass|upstream|include \\/data\\/nginx\\/proxy_host",
-      errors: "\\\\[emerg\\\\]|\\\\[warn\\\\]|duplicate location|configuration file .* test failed"
-    }};
-    const p = presets[tag] || "";
+    const re = PRESETS[tag];
+    if (!re) return;
+    // Suchfeld spiegelt den Filter weiter wider (editier-/verfeinerbar)
     regexModeEl.checked = true;
     wholeWordEl.checked = false;
-    qEl.value = p;
-    runSearch();
+    qEl.value = re.source;
+    renderCode(rawText, re);
   }}
 
   function clearHighlights() {{
@@ -666,7 +835,9 @@ def index(request: Request):
     // highlight matches by wrapping in spans
     // caution: we highlight in HTML space, so we work on raw string but insert markers safely
     const src = text || "";
-    let out = "";
+    // Stücke sammeln und einmal joinen statt out += pro Match:
+    // bei 20k Treffern wächst der String sonst quadratisch
+    const parts = [];
     let lastIndex = 0;
     matches = [];
     currentMatch = -1;
@@ -683,15 +854,17 @@ def index(request: Request):
         continue;
       }}
       matches.push([start, end]);
-      out += escapeHtml(src.slice(lastIndex, start));
-      out += `<span class="mark" data-midx="${{matches.length-1}}">${{escapeHtml(src.slice(start, end))}}</span>`;
+      parts.push(
+        escapeHtml(src.slice(lastIndex, start)),
+        `<span class="mark" data-midx="${{matches.length-1}}">${{escapeHtml(src.slice(start, end))}}</span>`
+      );
       lastIndex = end;
       // prevent catastrophic backtracking lock on empty matches
       if (matches.length > 20000) break;
     }}
-    out += escapeHtml(src.slice(lastIndex));
+    parts.push(escapeHtml(src.slice(lastIndex)));
 
-    codeEl.innerHTML = out || escapeHtml("—");
+    codeEl.innerHTML = parts.join("") || escapeHtml("—");
     // No hljs after we injected spans: still ok to run; it may wrap; so we skip to keep our spans stable.
     // hljs.highlightElement(codeEl);
 
@@ -702,9 +875,6 @@ def index(request: Request):
     }}
     hitEl.textContent = matches.length ? `${{currentMatch+1}}/${{matches.length}}` : "0/0";
     lastRenderedText = text;
-
-    // rebuild index based on raw (not highlighted html)
-    buildIndex(src);
   }}
 
   function scrollToMatch(idx) {{
@@ -733,7 +903,6 @@ def index(request: Request):
     const q = qEl.value.trim();
     if (!q) {{
       clearHighlights();
-      buildIndex(rawText);
       return;
     }}
     const re = buildRegexFromQuery(q);
@@ -741,61 +910,15 @@ def index(request: Request):
       // invalid regex
       hitEl.textContent = "0/0";
       renderCode(rawText); // show without highlights
-      buildIndex(rawText);
       return;
     }}
     renderCode(rawText, re);
   }}
 
-  function buildIndex(text) {{
-    // Best effort parsing of nginx -T output
-    // Index items: configuration file lines, http/stream blocks, and server blocks with server_name
-    const lines = (text || "").split("\\n");
-    const items = [];
-    let offset = 0;
-
-    function addItem(label, meta, pos) {{
-      items.push({{ label, meta, pos }});
-    }}
-
-    // pre-scan offsets for line->char position
-    const lineOffsets = [];
-    let acc = 0;
-    for (let i=0; i<lines.length; i++) {{
-      lineOffsets.push(acc);
-      acc += lines[i].length + 1;
-    }}
-
-    for (let i=0; i<lines.length; i++) {{
-      const line = lines[i];
-
-      if (line.startsWith("# configuration file ")) {{
-        addItem(line.replace("# configuration file ","").trim(), "file", lineOffsets[i]);
-        continue;
-      }}
-      if (/^http\\s*\\{{/.test(line.trim())) {{
-        addItem("http { ... }", "block", lineOffsets[i]);
-        continue;
-      }}
-      if (/^stream\\s*\\{{/.test(line.trim())) {{
-        addItem("stream { ... }", "block", lineOffsets[i]);
-        continue;
-      }}
-
-      // server block start (heuristic)
-      if (/^server\\s*\\{{/.test(line.trim())) {{
-        // look ahead for server_name
-        let name = "";
-        for (let j=i+1; j<Math.min(i+40, lines.length); j++) {{
-          const m = lines[j].match(/^\\s*server_name\\s+([^;]+);/);
-          if (m) {{ name = m[1].trim(); break; }}
-        }}
-        const label = name ? `server {{ ${{name}} }}` : "server {{ ... }}";
-        addItem(label, "server", lineOffsets[i]);
-      }}
-    }}
-
-    idxEl.innerHTML = "";
+  function renderIndex(items) {{
+    // Der Index selbst kommt fertig geparst vom Server (SERVER_INDEX),
+    // hier wird nur noch gerendert: ein zusammengebauter HTML-String und
+    // genau ein innerHTML-Write statt appendChild pro Eintrag
     if (!items.length) {{
       idxEl.innerHTML = '<div class="k">Kein Index möglich (noch keine Config?)</div>';
       idxInfoEl.textContent = "0 items";
@@ -803,19 +926,22 @@ def index(request: Request):
     }}
     idxInfoEl.textContent = `${{items.length}} items`;
 
+    const parts = [];
     for (const it of items) {{
-      const a = document.createElement("a");
-      a.href = "#";
-      a.innerHTML = `<div style="font-weight:800; font-size:12.8px;">${{escapeHtml(it.label)}}</div>
-                     <div class="meta">${{escapeHtml(it.meta)}}</div>`;
-      a.addEventListener("click", (ev) => {{
-        ev.preventDefault();
-        scrollToCharPos(it.pos);
-      }});
-      idxEl.appendChild(a);
+      parts.push(`<a href="#" data-pos="${{it.pos}}"><div style="font-weight:800; font-size:12.8px;">${{escapeHtml(it.label)}}</div><div class="meta">${{escapeHtml(it.meta)}}</div></a>`);
     }}
+    idxEl.innerHTML = parts.join("");
   }}
 
+  // Event-Delegation: ein Listener für alle Index-Links statt je einem
+  idxEl.addEventListener("click", (ev) => {{
+    const a = ev.target.closest("a[data-pos]");
+    if (a) {{
+      ev.preventDefault();
+      scrollToCharPos(+a.dataset.pos);
+    }}
+  }});
+
   function scrollToCharPos(pos) {{
     // Convert char position to an approximate scroll location in the PRE.
     // We'll search in the *rendered HTML* by walking text nodes would be heavy.
@@ -913,7 +1039,8 @@ async function showDiff() {{
       return;
     }}
     const diff = await r.text();
-    codeEl.innerHTML = escapeHtml(diff || "No changes.");
+    // textContent statt escape+innerHTML: kein Escape-Pass, kein HTML-Parse
+    codeEl.textContent = diff || "No changes.";
     hitEl.textContent = "0/0";
     matches = [];
     currentMatch = -1;
@@ -946,8 +1073,12 @@ async function showDiff() {{
     }});
   }});
 
-  // Search handlers
-  qEl.addEventListener("input", () => runSearch());
+  // Search handlers (debounced: Tipp-Bursts lösen nur einen Render aus)
+  let searchTimer = null;
+  qEl.addEventListener("input", () => {{
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(runSearch, 80);
+  }});
   [caseSensitiveEl, wholeWordEl, regexModeEl].forEach(x => x.addEventListener("change", () => runSearch()));
 
   qEl.addEventListener("keydown", (ev) => {{
@@ -962,13 +1093,84 @@ async function showDiff() {{
   }});
 
   // ---- Initial render ----
-  function init() {{
+  let cfgEtag = null;
+  async function loadConfig() {{
+    // Browser-HTTP-Cache + ETag: unveränderte Config kommt als 304 zurück
+    try {{
+      const r = await fetch("/config.txt", {{ cache: "no-cache" }});
+      rawText = r.ok ? await r.text() : "";
+      cfgEtag = r.headers.get("etag");
+    }} catch (e) {{
+      rawText = "";
+      cfgEtag = null;
+    }}
+  }}
+
+  function showError(msg) {{
+    let box = document.getElementById("err-box");
+    if (!msg) {{
+      if (box) box.remove();
+      return;
+    }}
+    if (!box) {{
+      box = document.createElement("div");
+      box.className = "err";
+      box.id = "err-box";
+      codeEl.parentElement.parentElement.prepend(box);
+    }}
+    box.innerHTML = "<b>Fehler:</b> ";
+    box.append(msg);
+  }}
+
+  // kein 303/Seiten-Reload mehr: /fetch liefert die Meta-Daten als JSON,
+  // die Config selbst wird nur bei geändertem ETag neu geladen
+  async function doFetch() {{
+    btnFetch.disabled = true;
+    try {{
+      const r = await fetch("/fetch", {{ method: "POST" }});
+      const meta = await r.json();
+      tsValEl.textContent = meta.ts_human || "—";
+      exitValEl.textContent = meta.exit_val;
+      chipExitEl.className = "chip " + meta.exit_chip_class;
+      showError(meta.err);
+      if (meta.err) return;
+
+      // alter Stand wird die Diff-Baseline im localStorage (noch mit altem TS)
+      const changed = !(meta.etag && meta.etag === cfgEtag);
+      if (changed && rawText) snapshotToLocalStorage();
+
+      SERVER_TS_ISO = meta.ts_iso;
+      SERVER_INDEX = meta.index;
+      SERVER_STATS = meta.stats;
+      renderIndex(SERVER_INDEX);
+      renderStats();
+      updateAge();
+
+      if (!changed) return;  // Config unverändert -> kein Reload nötig
+      await loadConfig();
+      if (qEl.value.trim()) {{
+        runSearch();
+      }} else {{
+        renderCode(rawText || "Noch keine Config geladen. Klick auf “Fetch nginx -T”.");
+      }}
+    }} catch (e) {{
+      showError(String(e));
+    }} finally {{
+      btnFetch.disabled = false;
+    }}
+  }}
+  btnFetch.addEventListener("click", doFetch);
+
+  async function init() {{
+    await loadConfig();
+
     // Always render raw text first
     renderCode(rawText || "Noch keine Config geladen. Klick auf “Fetch nginx -T”.");
-    buildIndex(rawText);
+    renderIndex(SERVER_INDEX);
 
-    updateAgeAndStats();
-    setInterval(updateAgeAndStats, 1000);
+    renderStats();
+    updateAge();
+    setInterval(updateAge, 1000);
 
     // Store a snapshot baseline *only if* we have content and no baseline yet
     if (rawText && !localStorage.getItem(LS_LAST)) {{
@@ -980,83 +1182,186 @@ async function showDiff() {{
 
 </body>
 </html>
-"""
+""")
+
+# fertig gerenderte Index-Seite; ändert sich nur durch /fetch
+_PAGE_CACHE = {"key": None, "page": ""}
+
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    _check_basic_auth(request)
+    _ensure_derived()
+
+    page_key = (CACHE["ts"], CACHE["err"], CACHE["exit_code"], CACHE["derived_for"])
+    if _PAGE_CACHE["key"] == page_key:
+        return HTMLResponse(_PAGE_CACHE["page"])
+
+    ts_iso = CACHE["ts_iso"]
+    ts_human = CACHE["ts_human"]
+    err = CACHE["err"] or ""
+
+    # safe_substitute, weil die eingebetteten JS-Template-Literals (`${...}`)
+    # sonst als Platzhalter interpretiert würden
+    page = _PAGE_TMPL.safe_substitute(
+        ts_human=markupsafe.escape(ts_human),
+        exit_chip_class=CACHE["exit_chip_class"],
+        exit_val=CACHE["exit_val"],
+        err_html=("<div class='err' id='err-box'><b>Fehler:</b> " + markupsafe.escape(err) + "</div>" if err else ""),
+        ts_iso_js=repr(ts_iso),
+        # Index- und Stats-JSON werden beim Fetch serialisiert, nicht pro Seitenaufruf
+        index_js=CACHE["index_js"],
+        stats_js=CACHE["stats_js"],
+    )
+    _PAGE_CACHE["key"] = page_key
+    _PAGE_CACHE["page"] = page
     return HTMLResponse(page)
 
 @app.post("/fetch")
-def fetch(request: Request):
+async def fetch(request: Request):
     _check_basic_auth(request)
     try:
-        text, code = fetch_nginx_T()
+        # exec blockiert (docker-py ist sync) -> in den Threadpool,
+        # damit der Event-Loop parallele Requests weiter bedienen kann
+        raw_bytes, code = await anyio.to_thread.run_sync(fetch_nginx_T)
 
         # rotate: aktueller Snapshot wird "previous"
-        if CACHE["text"]:
-            PREV["text"] = CACHE["text"]
+        if CACHE["text_bytes"]:
+            _ensure_derived()  # falls der letzte Postprocess noch aussteht
+            PREV["z"] = _ZSTD_C.compress(CACHE["text_bytes"])
+            PREV["hash"] = CACHE["hash"]
             PREV["ts"] = CACHE["ts"]
 
-        CACHE["text"] = text
+        CACHE["text_bytes"] = raw_bytes
         CACHE["ts"] = datetime.now(timezone.utc)
+        CACHE["ts_iso"] = CACHE["ts"].isoformat()
+        CACHE["ts_human"] = CACHE["ts"].strftime("%Y-%m-%d %H:%M:%S UTC")
         CACHE["err"] = None
         CACHE["exit_code"] = code
+        CACHE["exit_chip_class"] = "ok" if code == 0 else "bad"
+        CACHE["exit_val"] = str(code)
+
+        # die Meta-Antwort braucht ETag/Index/Stats -> Postprocess jetzt,
+        # aber im Threadpool (bei 5 MB Dump nicht den Event-Loop blockieren)
+        await anyio.to_thread.run_sync(_ensure_derived)
     except Exception as e:
         CACHE["err"] = str(e)
         CACHE["exit_code"] = None
-    return RedirectResponse("/", status_code=303)
+        CACHE["exit_chip_class"] = "warn"
+        CACHE["exit_val"] = ""
+
+    # kein 303 mehr: der Client aktualisiert Chips/Index selbst und lädt die
+    # Config nur dann neu, wenn sich das ETag geändert hat
+    return JSONResponse({
+        "ts_iso": CACHE["ts_iso"],
+        "ts_human": CACHE["ts_human"],
+        "etag": CACHE["etag"],
+        "err": CACHE["err"],
+        "exit_val": CACHE["exit_val"],
+        "exit_chip_class": CACHE["exit_chip_class"],
+        "index": CACHE["index"],
+        "stats": CACHE["stats"],
+    })
+
+# fertiger Diff zwischen PREV und CACHE; gültig bis zum nächsten Fetch
+_DIFF_CACHE = {"key": None, "text": ""}
 
 @app.get("/diff", response_class=PlainTextResponse)
-def diff(request: Request):
+async def diff(request: Request):
     _check_basic_auth(request)
 
-    if not PREV["text"]:
+    _ensure_derived()
+    if not PREV["z"]:
         return PlainTextResponse("No previous snapshot. Click Fetch at least twice.\n", status_code=404)
 
-    import difflib
+    # identische Snapshots (typisch: Re-Fetch ohne Config-Änderung) -> gar nicht erst diffen
+    if PREV["hash"] and PREV["hash"] == CACHE["hash"]:
+        return PlainTextResponse("")
 
-    old = PREV["text"].splitlines()
-    new = (CACHE["text"] or "").splitlines()
+    diff_key = (PREV["ts"], CACHE["ts"])
+    if _DIFF_CACHE["key"] == diff_key:
+        return PlainTextResponse(_DIFF_CACHE["text"])
 
     old_ts = PREV["ts"].isoformat() if PREV["ts"] else "previous"
     new_ts = CACHE["ts"].isoformat() if CACHE["ts"] else "current"
 
-    udiff = difflib.unified_diff(
-        old, new,
+    udiff = await _unified_diff(
+        _decompress_text(PREV["z"]), CACHE["text"] or "",
         fromfile=f"prev ({old_ts})",
         tofile=f"curr ({new_ts})",
-        lineterm=""
     )
-    return PlainTextResponse("\n".join(udiff) + "\n")
+    _DIFF_CACHE["key"] = diff_key
+    _DIFF_CACHE["text"] = udiff
+    return PlainTextResponse(udiff)
 
 @app.get("/raw", response_class=PlainTextResponse)
-def raw(request: Request):
+async def raw(request: Request, offset: int = 0, limit: int | None = None):
     _check_basic_auth(request)
-    if not CACHE["text"]:
+    if not CACHE["text_bytes"]:
         return PlainTextResponse("No config cached yet. POST /fetch first.\n", status_code=404)
-    return PlainTextResponse(CACHE["text"])
+    _ensure_derived()
+    data = CACHE["text_bytes"]
+
+    # ?offset=&limit= liefert nur den angefragten Ausschnitt (206),
+    # damit Clients nicht für jeden Blick den ganzen Dump ziehen müssen
+    if offset or limit is not None:
+        offset = max(0, offset)
+        end = len(data) if limit is None else min(len(data), offset + max(0, limit))
+        return Response(
+            content=bytes(memoryview(data)[offset:end]),
+            status_code=206,
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Range": f"bytes {offset}-{max(offset, end - 1)}/{len(data)}"},
+        )
+
+    return StreamingResponse(_iter_chunks(data), media_type="text/plain; charset=utf-8")
+
+@app.get("/config.txt", response_class=PlainTextResponse)
+async def config_txt(request: Request):
+    _check_basic_auth(request)
+    if not CACHE["text_bytes"]:
+        return PlainTextResponse("", status_code=404)
+    _ensure_derived()
+
+    etag = CACHE["etag"]
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return StreamingResponse(
+        _iter_chunks(CACHE["text_bytes"]),
+        media_type="text/plain; charset=utf-8",
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
 
 @app.get("/download")
-def download(request: Request):
+async def download(request: Request):
     _check_basic_auth(request)
-    if not CACHE["text"]:
+    if not CACHE["text_bytes"]:
         return PlainTextResponse("No config cached yet. POST /fetch first.\n", status_code=404)
+    _ensure_derived()
 
     ts = CACHE["ts"] or datetime.now(timezone.utc)
     fname = ts.strftime("npmplus-nginxT-%Y%m%d-%H%M%S.txt")
-    return Response(
-        content=CACHE["text"],
+    return StreamingResponse(
+        _iter_chunks(CACHE["text_bytes"]),
         media_type="text/plain; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{fname}"'}
+        headers={
+            "Content-Disposition": f'attachment; filename="{fname}"',
+            # bekannte Länge trotz Streaming -> Browser zeigt Download-Fortschritt
+            "Content-Length": str(len(CACHE["text_bytes"])),
+        }
     )
 
 @app.get("/authentik", response_class=HTMLResponse)
-def authentik_report(request: Request):
+async def authentik_report(request: Request):
     _check_basic_auth(request)
 
-    if not CACHE["text"]:
+    if not CACHE["text_bytes"]:
         return HTMLResponse(
             "<h3>Keine Config im Cache</h3><p>Bitte erst <b>Fetch nginx -T</b> klicken.</p>",
             status_code=400,
         )
 
+    _ensure_derived()
     rows = parse_proxy_hosts_authentik(CACHE["text"])
     secured = [r for r in rows if r["uses_authentik"]]
     open_ = [r for r in rows if not r["uses_authentik"]]
@@ -1082,13 +1387,13 @@ def authentik_report(request: Request):
       return f"""
         <tr class="{'ok' if r['uses_authentik'] else 'warn'}">
           <td>{badge}</td>
-          <td>{html.escape(r['id'])}</td>
-          <td><code>{html.escape(r['path'])}</code></td>
-          <td>{html.escape(names)}</td>
+          <td>{markupsafe.escape(r['id'])}</td>
+          <td><code>{markupsafe.escape(r['path'])}</code></td>
+          <td>{markupsafe.escape(names)}</td>
           <td>
             <div style="display:flex; flex-direction:column; gap:6px;">
-              <div><b>Authentik:</b> {html.escape(strong_txt)}</div>
-              <div><b>Hinweise:</b> {html.escape(weak_txt)}</div>
+              <div><b>Authentik:</b> {markupsafe.escape(strong_txt)}</div>
+              <div><b>Hinweise:</b> {markupsafe.escape(weak_txt)}</div>
             </div>
           </td>
         </tr>